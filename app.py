@@ -9,7 +9,7 @@
 • /when — посмотреть время публикации, /cancel_timer — отменить.
 
 Совместим с Python 3.12–3.14 (есть фикс event loop).
-Зависимости: python-telegram-bot==21.6
+Зависимости: python-telegram-bot==21.6, uvloop и orjson (необязательно, ускоряют event loop и разбор JSON)
 
 Для Railway:
 - загрузи этот проект в GitHub;
@@ -20,8 +20,11 @@
 
 import os
 import re
+import json
+import sqlite3
 import logging
 import asyncio
+from collections import OrderedDict
 from dataclasses import dataclass, field
 from typing import Dict, List, Optional, Tuple
 from datetime import datetime, timedelta
@@ -36,6 +39,8 @@ from telegram import (
     InputMediaVideo,
 )
 from telegram.constants import ParseMode
+from telegram.error import TelegramError
+from telegram.request import HTTPXRequest
 from telegram.ext import (
     ApplicationBuilder,
     CommandHandler,
@@ -45,6 +50,11 @@ from telegram.ext import (
     filters,
 )
 
+try:
+    import orjson
+except ImportError:  # необязательная зависимость
+    orjson = None
+
 # ---------- ЛОГИ ----------
 logging.basicConfig(
     level=logging.INFO,
@@ -57,6 +67,11 @@ BOT_TOKEN = os.getenv("TELEGRAM_BOT_TOKEN", "")
 TARGET_CHAT = "@mnogomorya"          # канал назначения
 ADMIN_USER_ID = 211779388            # твой user_id (только ты управляешь)
 LOCAL_TZ = ZoneInfo("Europe/Amsterdam")  # таймзона для таймера
+# SQLite с черновиками и таймерами; на Railway положи его на Volume, чтобы пережить редеплой
+DB_PATH = os.getenv("DRAFTS_DB", "drafts.sqlite3")
+
+# апдейты не от админа отсекаются фильтром ещё до вызова хендлеров
+ADMIN_FILTER = filters.User(user_id=ADMIN_USER_ID)
 
 if not BOT_TOKEN:
     raise SystemExit(
@@ -65,63 +80,248 @@ if not BOT_TOKEN:
     )
 
 # ---------- МОДЕЛИ ----------
+# виды медиа
+KIND_PHOTO = "photo"
+KIND_VIDEO = "video"
+KIND_DOCUMENT = "document"
+KIND_ANIMATION = "animation"
+KIND_AUDIO = "audio"
+KIND_VOICE = "voice"
+ALBUM_KINDS = (KIND_PHOTO, KIND_VIDEO)
+
+
 @dataclass
 class Draft:
     text: str = ""
-    # список медиа: ("photo"|"video"|"document"|"animation"|"audio"|"voice", file_id)
-    media: List[Tuple[str, str]] = field(default_factory=list)
+    # альбом (не больше 10): параллельные списки вида (KIND_PHOTO|KIND_VIDEO) и file_id
+    album_kinds: List[str] = field(default_factory=list)
+    album_file_ids: List[str] = field(default_factory=list)
+    # одиночки: "document"|"animation"|"audio"|"voice" -> file_id (последний добавленный — в конце)
+    singles: Dict[str, str] = field(default_factory=dict)
+    # кэш для summarize_draft; сбрасывается в add_media_to_draft / set_text_from
+    _summary: Optional[str] = field(default=None, repr=False, compare=False)
+    _kind_counts: Dict[str, int] = field(default_factory=dict, repr=False, compare=False)
+    # размер, уже учтённый в DRAFTS_BYTES (см. draft_changed)
+    _bytes: int = field(default=0, repr=False, compare=False)
 
     def is_empty(self) -> bool:
-        return not self.text and not self.media
+        return not self.text and not self.album_file_ids and not self.singles
 
     def copy(self) -> "Draft":
-        return Draft(text=self.text, media=list(self.media))
+        return Draft(
+            text=self.text,
+            album_kinds=list(self.album_kinds),
+            album_file_ids=list(self.album_file_ids),
+            singles=dict(self.singles),
+            _kind_counts=dict(self._kind_counts),
+        )
 
 
 @dataclass
 class ScheduledJob:
     when: datetime
-    task: asyncio.Task
+    # до срока висит лёгкий TimerHandle, задача публикации создаётся только при срабатывании
+    handle: Optional[asyncio.TimerHandle] = None
+    task: Optional[asyncio.Task] = None
+
+    def active(self) -> bool:
+        if self.task is not None:
+            return not self.task.done()
+        return self.handle is not None and not self.handle.cancelled()
+
+    def cancel(self) -> None:
+        if self.handle is not None:
+            self.handle.cancel()
+        if self.task is not None and not self.task.done():
+            self.task.cancel()
+
+
+# хранилища в памяти процесса; DRAFTS — LRU с лимитом по числу и размеру
+MAX_DRAFTS = 1024
+MAX_DRAFTS_BYTES = 4 * 1024 * 1024
+DRAFTS: "OrderedDict[int, Draft]" = OrderedDict()
+DRAFTS_BYTES = 0  # сумма draft_bytes по DRAFTS, ведётся инкрементально
+SCHEDULES: Dict[int, ScheduledJob] = {}
 
+# альбомы (media_group_id): копим элементы и отвечаем один раз на весь альбом
+MEDIA_GROUP_DELAY = 0.6  # сек. ожидания следующих элементов альбома
+MEDIA_GROUP_BUFFERS: Dict[str, List[Tuple[str, str]]] = {}
+MEDIA_GROUP_TASKS: Dict[str, asyncio.Task] = {}
+
+# текст: при быстрых правках/вставках по кускам отвечаем один раз, по последнему состоянию
+TEXT_REPLY_DELAY = 0.3  # сек.
+TEXT_REPLY_TASKS: Dict[int, asyncio.Task] = {}
+
+# ---------- ХРАНИЛИЩЕ НА ДИСКЕ ----------
+DB: Optional[sqlite3.Connection] = None
+
+
+def db_open(path: str) -> None:
+    global DB
+    DB = sqlite3.connect(path)
+    DB.execute("PRAGMA journal_mode=WAL")
+    # в WAL безопасно: без fsync на каждый коммит, пишем мы на каждом апдейте
+    DB.execute("PRAGMA synchronous=NORMAL")
+    DB.execute("CREATE TABLE IF NOT EXISTS drafts (uid INTEGER PRIMARY KEY, data TEXT NOT NULL)")
+    DB.execute(
+        "CREATE TABLE IF NOT EXISTS schedules "
+        "(uid INTEGER PRIMARY KEY, at TEXT NOT NULL, data TEXT NOT NULL)"
+    )
+    DB.commit()
+
+
+def draft_to_json(d: Draft) -> str:
+    # ключ "photos_videos" (список пар) оставлен ради совместимости с уже сохранёнными черновиками
+    return json.dumps(
+        {
+            "text": d.text,
+            "photos_videos": list(zip(d.album_kinds, d.album_file_ids)),
+            "singles": d.singles,
+        }
+    )
+
+
+def draft_from_json(data: str) -> Draft:
+    raw = json.loads(data)
+    d = Draft(text=raw.get("text", ""))
+    # через add_media_to_draft, чтобы заодно восстановить счётчики видов медиа
+    for kind, fid in raw.get("photos_videos", []):
+        add_media_to_draft(d, kind, fid)
+    for kind, fid in raw.get("singles", {}).items():
+        add_media_to_draft(d, kind, fid)
+    return d
+
+
+def save_draft(uid: int, d: Draft) -> None:
+    if DB is None:
+        return
+    with DB:
+        if d.is_empty():
+            DB.execute("DELETE FROM drafts WHERE uid = ?", (uid,))
+        else:
+            DB.execute("REPLACE INTO drafts (uid, data) VALUES (?, ?)", (uid, draft_to_json(d)))
+
+
+def save_schedule(uid: int, when: datetime, d: Draft) -> None:
+    if DB is None:
+        return
+    with DB:
+        DB.execute(
+            "REPLACE INTO schedules (uid, at, data) VALUES (?, ?, ?)",
+            (uid, when.isoformat(), draft_to_json(d)),
+        )
+
+
+def pop_schedule(uid: int) -> Optional[ScheduledJob]:
+    """Убрать таймер из памяти и с диска (не отменяя его — это делает вызывающий)."""
+    if DB is not None:
+        with DB:
+            DB.execute("DELETE FROM schedules WHERE uid = ?", (uid,))
+    return SCHEDULES.pop(uid, None)
 
-# хранилища в памяти процесса
-DRAFTS: Dict[int, Draft] = {}
-SCHEDULES: Dict[int, ScheduledJob] = {}
 
 # ---------- УТИЛИТЫ ----------
 def authorized(user_id: int) -> bool:
     return int(user_id) == int(ADMIN_USER_ID)
 
 
+def draft_bytes(d: Draft) -> int:
+    """Грубая оценка размера черновика: текст + file_id."""
+    return (
+        len(d.text.encode())
+        + sum(len(fid) for fid in d.album_file_ids)
+        + sum(len(fid) for fid in d.singles.values())
+    )
+
+
+def evict_drafts(keep: int) -> None:
+    """
+    Выкинуть самые старые черновики, пока не уложимся в MAX_DRAFTS / MAX_DRAFTS_BYTES.
+    Таймер выкинутого пользователя тоже отменяем. Черновик keep не трогаем.
+    """
+    global DRAFTS_BYTES
+    while len(DRAFTS) > MAX_DRAFTS or DRAFTS_BYTES > MAX_DRAFTS_BYTES:
+        uid = next(iter(DRAFTS))
+        if uid == keep:
+            break
+        DRAFTS_BYTES -= DRAFTS.pop(uid)._bytes
+        save_draft(uid, Draft())
+        sched = pop_schedule(uid)
+        if sched and sched.active():
+            sched.cancel()
+        logger.info("Draft of user_id %s evicted", uid)
+
+
+def draft_changed(uid: int, d: Draft) -> None:
+    """
+    Вызывать после каждого изменения черновика из DRAFTS:
+    обновляет DRAFTS_BYTES, при превышении лимитов выкидывает старые черновики и сохраняет на диск.
+    """
+    global DRAFTS_BYTES
+    size = draft_bytes(d)
+    DRAFTS_BYTES += size - d._bytes
+    d._bytes = size
+    evict_drafts(keep=uid)
+    save_draft(uid, d)
+
+
+def reset_draft(uid: int) -> None:
+    global DRAFTS_BYTES
+    old = DRAFTS.get(uid)
+    if old is not None:
+        DRAFTS_BYTES -= old._bytes
+    DRAFTS[uid] = Draft()
+    save_draft(uid, DRAFTS[uid])
+
+
 def get_draft(user_id: int) -> Draft:
-    if user_id not in DRAFTS:
-        DRAFTS[user_id] = Draft()
-    return DRAFTS[user_id]
+    d = DRAFTS.get(user_id)
+    if d is None:
+        d = DRAFTS[user_id] = Draft()
+        evict_drafts(keep=user_id)
+    else:
+        DRAFTS.move_to_end(user_id)
+    return d
 
 
 def summarize_draft(d: Draft) -> str:
+    if d._summary is not None:
+        return d._summary
     parts = []
     if d.text:
         parts.append(f"📝 <b>Текст</b>:\n{d.text}")
-    if d.media:
-        kinds = [k for (k, _) in d.media]
-        parts.append("🖼 <b>Медиа</b>: " + ", ".join(kinds))
+    if d._kind_counts:
+        parts.append(
+            "🖼 <b>Медиа</b>: "
+            + ", ".join(f"{k}×{c}" if c > 1 else k for k, c in d._kind_counts.items())
+        )
     if not parts:
-        return "Черновик пуст. Пришли текст или фото/видео (можно несколько подряд для альбома)."
-    return "\n\n".join(parts)
+        d._summary = "Черновик пуст. Пришли текст или фото/видео (можно несколько подряд для альбома)."
+    else:
+        d._summary = "\n\n".join(parts)
+    return d._summary
 
 
-def keyboard() -> InlineKeyboardMarkup:
-    return InlineKeyboardMarkup(
+# клавиатура неизменна — собираем один раз и переиспользуем во всех ответах
+KEYBOARD = InlineKeyboardMarkup(
+    [
+        [InlineKeyboardButton("📄 Предпросмотр", callback_data="prev")],
         [
-            [InlineKeyboardButton("📄 Предпросмотр", callback_data="prev")],
-            [
-                InlineKeyboardButton("📢 Опубликовать", callback_data="pub"),
-                InlineKeyboardButton("🗑 Очистить", callback_data="clr"),
-            ],
-            [InlineKeyboardButton("⏰ Подсказка по таймеру: /timer", callback_data="noop")],
-        ]
-    )
+            InlineKeyboardButton("📢 Опубликовать", callback_data="pub"),
+            InlineKeyboardButton("🗑 Очистить", callback_data="clr"),
+        ],
+        [InlineKeyboardButton("⏰ Подсказка по таймеру: /timer", callback_data="noop")],
+    ]
+)
+
+
+def _strip_command(text: str, entities) -> str:
+    """Отрезать ведущую /команду (если есть) и вернуть полезную часть текста."""
+    if entities:
+        for e in entities:
+            if e.type == MessageEntity.BOT_COMMAND and e.offset == 0:
+                return text[e.length :].strip()
+    return text.strip()
 
 
 def set_text_from(update: Update, draft: Draft) -> None:
@@ -129,34 +329,35 @@ def set_text_from(update: Update, draft: Draft) -> None:
     if not msg:
         return
     if msg.text:
-        entities = msg.entities or []
-        cmd = next((e for e in entities if e.type == MessageEntity.BOT_COMMAND), None)
-        draft.text = (msg.text[cmd.offset + cmd.length :] if cmd else msg.text).strip()
+        draft.text = _strip_command(msg.text, msg.entities)
+        draft._summary = None
     elif msg.caption:
-        entities = msg.caption_entities or []
-        cmd = next((e for e in entities if e.type == MessageEntity.BOT_COMMAND), None)
-        draft.text = (msg.caption[cmd.offset + cmd.length :] if cmd else msg.caption).strip()
+        draft.text = _strip_command(msg.caption, msg.caption_entities)
+        draft._summary = None
 
 
 def add_media_to_draft(draft: Draft, kind: str, file_id: str) -> None:
     """
     Фото/видео копятся для альбома (до 10).
-    Остальные типы ведём как одиночки (берём последние, но не трогаем альбом фото/видео).
+    Остальные типы ведём как одиночки: по одному слоту на тип, новый заменяет старый.
     """
-    if kind in ("photo", "video"):
-        draft.media.append((kind, file_id))
-        draft.media = draft.media[-10:]  # лимит Телеграма
+    counts = draft._kind_counts
+    if kind in ALBUM_KINDS:
+        draft.album_kinds.append(kind)
+        draft.album_file_ids.append(file_id)
+        counts[kind] = counts.get(kind, 0) + 1
+        if len(draft.album_file_ids) > 10:  # лимит Телеграма
+            draft.album_file_ids.pop(0)
+            dropped = draft.album_kinds.pop(0)
+            counts[dropped] -= 1
+            if not counts[dropped]:
+                del counts[dropped]
     else:
-        draft.media.append((kind, file_id))
-        seen = set()
-        new_media: List[Tuple[str, str]] = []
-        for k, fid in reversed(draft.media):
-            if k in ("photo", "video"):
-                new_media.append((k, fid))
-            elif k not in seen:
-                seen.add(k)
-                new_media.append((k, fid))
-        draft.media = list(reversed(new_media))
+        # pop + вставка, чтобы самый свежий одиночка оказался в конце
+        if draft.singles.pop(kind, None) is None:
+            counts[kind] = 1
+        draft.singles[kind] = file_id
+    draft._summary = None
 
 
 def draft_to_media_group(d: Draft) -> Optional[List]:
@@ -164,13 +365,14 @@ def draft_to_media_group(d: Draft) -> Optional[List]:
     Если в черновике фото/видео >= 2 — вернуть список InputMedia для send_media_group.
     Подпись ставим только в первый элемент.
     """
-    pv = [(k, fid) for (k, fid) in d.media if k in ("photo", "video")]
-    if len(pv) < 2:
+    # sendMediaGroup принимает только 2–10 элементов, поэтому одиночное фото/видео
+    # отправляется отдельным send_photo/send_video (см. SENDERS), а не группой из одного
+    if len(d.album_file_ids) < 2:
         return None
     items = []
-    for idx, (k, fid) in enumerate(pv):
+    for idx, (kind, fid) in enumerate(zip(d.album_kinds, d.album_file_ids)):
         caption = d.text if idx == 0 else None
-        if k == "photo":
+        if kind == KIND_PHOTO:
             items.append(
                 InputMediaPhoto(
                     media=fid,
@@ -189,111 +391,144 @@ def draft_to_media_group(d: Draft) -> Optional[List]:
     return items
 
 
-async def send_preview(uid: int, d: Draft, ctx: ContextTypes.DEFAULT_TYPE) -> None:
+def last_single_media(d: Draft) -> Optional[Tuple[str, str]]:
+    """
+    Что отправлять, если альбома нет: фото/видео (если есть), иначе самый свежий одиночка.
+    """
+    if d.album_file_ids:
+        return d.album_kinds[-1], d.album_file_ids[-1]
+    if d.singles:
+        return next(reversed(d.singles.items()))
+    return None
+
+
+# kind -> метод бота для одиночной отправки
+SENDERS: Dict[str, str] = {
+    KIND_PHOTO: "send_photo",
+    KIND_VIDEO: "send_video",
+    KIND_DOCUMENT: "send_document",
+    KIND_ANIMATION: "send_animation",
+    KIND_AUDIO: "send_audio",
+    KIND_VOICE: "send_voice",
+}
+
+
+async def _send_one(chat_id, kind: str, fid: str, caption: Optional[str], bot) -> None:
+    await getattr(bot, SENDERS[kind])(chat_id, fid, caption=caption, parse_mode=ParseMode.HTML)
+
+
+async def _send_draft(chat_id, d: Draft, bot, empty_text: str) -> None:
     group = draft_to_media_group(d)
     if group:
-        await ctx.bot.send_media_group(chat_id=uid, media=group)
+        await bot.send_media_group(chat_id=chat_id, media=group)
         return
-    if d.media:
-        kind, fid = d.media[-1]
-        if kind == "photo":
-            await ctx.bot.send_photo(uid, fid, caption=d.text or None, parse_mode=ParseMode.HTML)
-        elif kind == "video":
-            await ctx.bot.send_video(uid, fid, caption=d.text or None, parse_mode=ParseMode.HTML)
-        elif kind == "document":
-            await ctx.bot.send_document(uid, fid, caption=d.text or None, parse_mode=ParseMode.HTML)
-        elif kind == "animation":
-            await ctx.bot.send_animation(uid, fid, caption=d.text or None, parse_mode=ParseMode.HTML)
-        elif kind == "audio":
-            await ctx.bot.send_audio(uid, fid, caption=d.text or None, parse_mode=ParseMode.HTML)
-        elif kind == "voice":
-            await ctx.bot.send_voice(uid, fid, caption=d.text or None, parse_mode=ParseMode.HTML)
-        else:
-            await ctx.bot.send_message(uid, summarize_draft(d), parse_mode=ParseMode.HTML)
+    last = last_single_media(d)
+    if last:
+        kind, fid = last
+        await _send_one(chat_id, kind, fid, d.text or None, bot)
     else:
-        await ctx.bot.send_message(uid, d.text or "Черновик пуст.", parse_mode=ParseMode.HTML)
+        await bot.send_message(chat_id, d.text or empty_text, parse_mode=ParseMode.HTML)
+
+
+async def send_preview(uid: int, d: Draft, ctx: ContextTypes.DEFAULT_TYPE) -> None:
+    await _send_draft(uid, d, ctx.bot, "Черновик пуст.")
 
 
 async def publish_to_channel(d: Draft, ctx: ContextTypes.DEFAULT_TYPE) -> None:
-    group = draft_to_media_group(d)
-    if group:
-        await ctx.bot.send_media_group(chat_id=TARGET_CHAT, media=group)
+    await _send_draft(TARGET_CHAT, d, ctx.bot, "")
+
+
+async def _flush_group(key: str, uid: int, msg, ctx: ContextTypes.DEFAULT_TYPE) -> None:
+    """
+    Ждём, пока Телеграм дошлёт остальные элементы альбома,
+    затем добавляем их в черновик разом и отвечаем одним сообщением.
+    """
+    try:
+        await asyncio.sleep(MEDIA_GROUP_DELAY)
+    except asyncio.CancelledError:
         return
-    if d.media:
-        kind, fid = d.media[-1]
-        if kind == "photo":
-            await ctx.bot.send_photo(TARGET_CHAT, fid, caption=d.text or None, parse_mode=ParseMode.HTML)
-        elif kind == "video":
-            await ctx.bot.send_video(TARGET_CHAT, fid, caption=d.text or None, parse_mode=ParseMode.HTML)
-        elif kind == "document":
-            await ctx.bot.send_document(TARGET_CHAT, fid, caption=d.text or None, parse_mode=ParseMode.HTML)
-        elif kind == "animation":
-            await ctx.bot.send_animation(TARGET_CHAT, fid, caption=d.text or None, parse_mode=ParseMode.HTML)
-        elif kind == "audio":
-            await ctx.bot.send_audio(TARGET_CHAT, fid, caption=d.text or None, parse_mode=ParseMode.HTML)
-        elif kind == "voice":
-            await ctx.bot.send_voice(TARGET_CHAT, fid, caption=d.text or None, parse_mode=ParseMode.HTML)
-        else:
-            await ctx.bot.send_message(TARGET_CHAT, d.text or "", parse_mode=ParseMode.HTML)
-    else:
-        await ctx.bot.send_message(TARGET_CHAT, d.text or "", parse_mode=ParseMode.HTML)
+    MEDIA_GROUP_TASKS.pop(key, None)
+    items = MEDIA_GROUP_BUFFERS.pop(key, [])
+    d = get_draft(uid)
+    for kind, fid in items:
+        add_media_to_draft(d, kind, fid)
+    draft_changed(uid, d)
+    await msg.reply_html(summarize_draft(d), reply_markup=KEYBOARD)
+
+
+async def _debounced_reply(uid: int, msg) -> None:
+    """Ответить сводкой черновика, если за TEXT_REPLY_DELAY не пришло новых правок текста."""
+    try:
+        await asyncio.sleep(TEXT_REPLY_DELAY)
+    except asyncio.CancelledError:
+        return
+    TEXT_REPLY_TASKS.pop(uid, None)
+    await msg.reply_html(summarize_draft(get_draft(uid)), reply_markup=KEYBOARD)
+
+
+def queue_media_group(update: Update, ctx: ContextTypes.DEFAULT_TYPE, uid: int, kind: str, file_id: str) -> bool:
+    """
+    Если сообщение — часть альбома, кладём медиа в буфер и (пере)запускаем отложенный сброс.
+    Возвращает True, если медиа ушло в буфер и отвечать сразу не нужно.
+    """
+    msg = update.effective_message
+    mgid = msg.media_group_id
+    if not mgid:
+        return False
+    key = f"{uid}:{mgid}"
+    MEDIA_GROUP_BUFFERS.setdefault(key, []).append((kind, file_id))
+    old = MEDIA_GROUP_TASKS.get(key)
+    if old and not old.done():
+        old.cancel()
+    # через PTB, чтобы ошибки отложенного ответа дошли до его обработчика ошибок
+    MEDIA_GROUP_TASKS[key] = ctx.application.create_task(_flush_group(key, uid, msg, ctx), update=update)
+    return True
 
 
 # ---------- ПАРСИНГ ВРЕМЕНИ ----------
-TIME_HHMM = re.compile(r"^\s*(\d{1,2}):(\d{2})\s*$")
-TIME_ABS = re.compile(r"^\s*(\d{4})-(\d{2})-(\d{2})\s+(\d{1,2}):(\d{2})\s*$")
-TIME_REL = re.compile(r"^\s*in\s+(\d+)\s*(m|min|h|hr|d)\s*$", re.IGNORECASE)
+TIME_RE = re.compile(
+    r"^\s*(?:"
+    r"(?P<h>\d{1,2}):(?P<m>\d{2})"                                       # HH:MM
+    r"|(?P<Y>\d{4})-(?P<mo>\d{2})-(?P<d>\d{2})\s+(?P<h2>\d{1,2}):(?P<m2>\d{2})"  # YYYY-MM-DD HH:MM
+    r"|in\s+(?P<n>\d+)\s*(?P<u>m|min|h|hr|d)"                            # in 10m / 2h / 1d
+    r")\s*$",
+    re.IGNORECASE,
+)
 
 
 def parse_when(s: str, now: datetime) -> Optional[datetime]:
+    m = TIME_RE.match(s)
+    if not m:
+        return None
+
     # HH:MM
-    m = TIME_HHMM.match(s)
-    if m:
-        hh, mm = int(m.group(1)), int(m.group(2))
+    if m.group("h") is not None:
+        hh, mm = int(m.group("h")), int(m.group("m"))
         dt = now.replace(hour=hh, minute=mm, second=0, microsecond=0)
         if dt <= now:
             dt = dt + timedelta(days=1)
         return dt
 
     # YYYY-MM-DD HH:MM
-    m = TIME_ABS.match(s)
-    if m:
-        y, mo, d, hh, mm = map(int, m.groups())
+    if m.group("Y") is not None:
+        y, mo, d, hh, mm = map(int, m.group("Y", "mo", "d", "h2", "m2"))
         try:
             return datetime(y, mo, d, hh, mm, tzinfo=now.tzinfo)
         except ValueError:
             return None
 
     # in 10m / 2h / 1d
-    m = TIME_REL.match(s)
-    if m:
-        amount = int(m.group(1))
-        unit = m.group(2).lower()
-        if unit in ("m", "min"):
-            return now + timedelta(minutes=amount)
-        if unit in ("h", "hr"):
-            return now + timedelta(hours=amount)
-        if unit == "d":
-            return now + timedelta(days=amount)
-
-    return None
+    amount = int(m.group("n"))
+    unit = m.group("u").lower()
+    if unit in ("m", "min"):
+        return now + timedelta(minutes=amount)
+    if unit in ("h", "hr"):
+        return now + timedelta(hours=amount)
+    return now + timedelta(days=amount)
 
 
 # ---------- ХЕНДЛЕРЫ ----------
-async def ensure_auth(update: Update) -> Optional[int]:
-    u = update.effective_user
-    if not u:
-        return None
-    if authorized(u.id):
-        return u.id
-    await update.effective_message.reply_text("⛔️ У тебя нет прав управлять этим ботом.")
-    return None
-
-
 async def cmd_start(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
-    uid = await ensure_auth(update)
-    if uid is None:
-        return
     await update.effective_message.reply_text(
         "Привет! Я бот-редактор постов для @mnogomorya.\n\n"
         "• Пришли текст — создам черновик.\n"
@@ -305,22 +540,49 @@ async def cmd_start(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
         "• /timer in 10m | 2h | 1d\n"
         "• /when — узнать время\n"
         "• /cancel_timer — отмена",
-        reply_markup=keyboard(),
+        reply_markup=KEYBOARD,
         parse_mode=ParseMode.HTML,
     )
 
 
 async def cmd_whoami(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
-    uid = await ensure_auth(update)
-    if uid is None:
-        return
+    uid = update.effective_user.id
     await update.effective_message.reply_html(f"Твой user_id: <code>{uid}</code>")
 
 
+async def _run_publish(draft: Draft, uid: int, when: datetime, app) -> None:
+    try:
+        await publish_to_channel(draft, app)
+        await app.bot.send_message(
+            uid,
+            f"✅ Опубликовано по таймеру: {when.strftime('%Y-%m-%d %H:%M')}",
+        )
+        pop_schedule(uid)
+    except asyncio.CancelledError:
+        pass
+    except Exception as e:
+        logger.exception("Scheduled publish error")
+        pop_schedule(uid)
+        await app.bot.send_message(uid, f"Ошибка отложенной публикации: {e}")
+
+
+def schedule_publish(uid: int, draft: Draft, when: datetime, delay: float, app) -> None:
+    """
+    Поставить отложенную публикацию. app — Application (context.application в хендлерах,
+    сам app при восстановлении после рестарта).
+    """
+    sched = ScheduledJob(when=when)
+
+    def fire() -> None:
+        # через PTB, чтобы ошибки публикации дошли до его обработчика ошибок
+        sched.task = app.create_task(_run_publish(draft, uid, when, app))
+
+    sched.handle = asyncio.get_running_loop().call_later(delay, fire)
+    SCHEDULES[uid] = sched
+
+
 async def cmd_timer(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
-    uid = await ensure_auth(update)
-    if uid is None:
-        return
+    uid = update.effective_user.id
     if not context.args:
         await update.effective_message.reply_text(
             "Форматы: /timer HH:MM | YYYY-MM-DD HH:MM | in 10m|2h|1d"
@@ -336,55 +598,34 @@ async def cmd_timer(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
         )
         return
 
-    draft = get_draft(uid).copy()
-    if draft.is_empty():
+    if get_draft(uid).is_empty():
         await update.effective_message.reply_text("Черновик пуст — нечего планировать.")
         return
+    draft = get_draft(uid).copy()
 
     old = SCHEDULES.get(uid)
-    if old and not old.task.done():
-        old.task.cancel()
-
-    async def job():
-        try:
-            delay = (when - datetime.now(LOCAL_TZ)).total_seconds()
-            if delay > 0:
-                await asyncio.sleep(delay)
-            await publish_to_channel(draft, context)
-            await context.bot.send_message(
-                uid,
-                f"✅ Опубликовано по таймеру: {when.strftime('%Y-%m-%d %H:%M')}",
-            )
-            SCHEDULES.pop(uid, None)
-        except asyncio.CancelledError:
-            pass
-        except Exception as e:
-            logger.exception("Scheduled publish error")
-            await context.bot.send_message(uid, f"Ошибка отложенной публикации: {e}")
+    if old and old.active():
+        old.cancel()
 
-    t = asyncio.create_task(job())
-    SCHEDULES[uid] = ScheduledJob(when=when, task=t)
+    schedule_publish(uid, draft, when, max(0.0, (when - now).total_seconds()), context.application)
+    save_schedule(uid, when, draft)
     await update.effective_message.reply_text(
         f"⏰ Запланировал на {when.strftime('%Y-%m-%d %H:%M %Z')}"
     )
 
 
 async def cmd_cancel_timer(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
-    uid = await ensure_auth(update)
-    if uid is None:
-        return
-    sched = SCHEDULES.pop(uid, None)
-    if sched and not sched.task.done():
-        sched.task.cancel()
+    uid = update.effective_user.id
+    sched = pop_schedule(uid)
+    if sched and sched.active():
+        sched.cancel()
         await update.effective_message.reply_text("❌ Таймер отменён.")
     else:
         await update.effective_message.reply_text("Нет активного таймера.")
 
 
 async def cmd_when(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
-    uid = await ensure_auth(update)
-    if uid is None:
-        return
+    uid = update.effective_user.id
     sched = SCHEDULES.get(uid)
     if not sched:
         await update.effective_message.reply_text("Нет запланированной публикации.")
@@ -396,73 +637,82 @@ async def cmd_when(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
 
 # ---- текст и медиа ----
 async def on_text(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
-    uid = await ensure_auth(update)
-    if uid is None:
-        return
+    uid = update.effective_user.id
     d = get_draft(uid)
     set_text_from(update, d)
-    await update.effective_message.reply_html(summarize_draft(d), reply_markup=keyboard())
+    draft_changed(uid, d)
+    old = TEXT_REPLY_TASKS.get(uid)
+    if old and not old.done():
+        old.cancel()
+    TEXT_REPLY_TASKS[uid] = context.application.create_task(
+        _debounced_reply(uid, update.effective_message), update=update
+    )
 
 
 async def on_photo(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
-    uid = await ensure_auth(update)
-    if uid is None:
-        return
+    uid = update.effective_user.id
     d = get_draft(uid)
     file_id = update.effective_message.photo[-1].file_id
-    add_media_to_draft(d, "photo", file_id)
     set_text_from(update, d)
-    await update.effective_message.reply_html(summarize_draft(d), reply_markup=keyboard())
+    if queue_media_group(update, context, uid, KIND_PHOTO, file_id):
+        return
+    add_media_to_draft(d, KIND_PHOTO, file_id)
+    draft_changed(uid, d)
+    await update.effective_message.reply_html(summarize_draft(d), reply_markup=KEYBOARD)
 
 
 async def on_video(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
-    uid = await ensure_auth(update)
-    if uid is None:
-        return
+    uid = update.effective_user.id
     d = get_draft(uid)
-    add_media_to_draft(d, "video", update.effective_message.video.file_id)
+    file_id = update.effective_message.video.file_id
     set_text_from(update, d)
-    await update.effective_message.reply_html(summarize_draft(d), reply_markup=keyboard())
+    if queue_media_group(update, context, uid, KIND_VIDEO, file_id):
+        return
+    add_media_to_draft(d, KIND_VIDEO, file_id)
+    draft_changed(uid, d)
+    await update.effective_message.reply_html(summarize_draft(d), reply_markup=KEYBOARD)
 
 
 async def on_document(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
-    uid = await ensure_auth(update)
-    if uid is None:
-        return
+    uid = update.effective_user.id
     d = get_draft(uid)
-    add_media_to_draft(d, "document", update.effective_message.document.file_id)
+    file_id = update.effective_message.document.file_id
     set_text_from(update, d)
-    await update.effective_message.reply_html(summarize_draft(d), reply_markup=keyboard())
+    if queue_media_group(update, context, uid, KIND_DOCUMENT, file_id):
+        return
+    add_media_to_draft(d, KIND_DOCUMENT, file_id)
+    draft_changed(uid, d)
+    await update.effective_message.reply_html(summarize_draft(d), reply_markup=KEYBOARD)
 
 
 async def on_animation(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
-    uid = await ensure_auth(update)
-    if uid is None:
-        return
+    uid = update.effective_user.id
     d = get_draft(uid)
-    add_media_to_draft(d, "animation", update.effective_message.animation.file_id)
+    file_id = update.effective_message.animation.file_id
     set_text_from(update, d)
-    await update.effective_message.reply_html(summarize_draft(d), reply_markup=keyboard())
+    if queue_media_group(update, context, uid, KIND_ANIMATION, file_id):
+        return
+    add_media_to_draft(d, KIND_ANIMATION, file_id)
+    draft_changed(uid, d)
+    await update.effective_message.reply_html(summarize_draft(d), reply_markup=KEYBOARD)
 
 
 async def on_audio(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
-    uid = await ensure_auth(update)
-    if uid is None:
-        return
+    uid = update.effective_user.id
     d = get_draft(uid)
-    add_media_to_draft(d, "audio", update.effective_message.audio.file_id)
+    add_media_to_draft(d, KIND_AUDIO, update.effective_message.audio.file_id)
     set_text_from(update, d)
-    await update.effective_message.reply_html(summarize_draft(d), reply_markup=keyboard())
+    draft_changed(uid, d)
+    await update.effective_message.reply_html(summarize_draft(d), reply_markup=KEYBOARD)
 
 
 async def on_voice(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
-    uid = await ensure_auth(update)
-    if uid is None:
-        return
+    uid = update.effective_user.id
     d = get_draft(uid)
-    add_media_to_draft(d, "voice", update.effective_message.voice.file_id)
+    add_media_to_draft(d, KIND_VOICE, update.effective_message.voice.file_id)
     set_text_from(update, d)
-    await update.effective_message.reply_html(summarize_draft(d), reply_markup=keyboard())
+    draft_changed(uid, d)
+    await update.effective_message.reply_html(summarize_draft(d), reply_markup=KEYBOARD)
 
 
 # ---- кнопки ----
@@ -481,68 +731,112 @@ async def on_cb(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
 
     if q.data == "prev":
         if d.is_empty():
-            await q.edit_message_text("Черновик пуст. Пришли текст или медиа.", reply_markup=keyboard())
+            await q.edit_message_text("Черновик пуст. Пришли текст или медиа.", reply_markup=KEYBOARD)
             return
         await send_preview(uid, d, context)
         return
 
     if q.data == "pub":
         if d.is_empty():
-            await q.edit_message_text("Нечего публиковать.", reply_markup=keyboard())
+            await q.edit_message_text("Нечего публиковать.", reply_markup=KEYBOARD)
             return
         try:
             await publish_to_channel(d, context)
             await q.edit_message_text("✅ Опубликовано в @mnogomorya")
-            DRAFTS[uid] = Draft()
-            sched = SCHEDULES.pop(uid, None)
-            if sched and not sched.task.done():
-                sched.task.cancel()
+            reset_draft(uid)
+            sched = pop_schedule(uid)
+            if sched and sched.active():
+                sched.cancel()
         except Exception as e:
             logger.exception("Publish error")
-            await q.edit_message_text(f"Ошибка публикации: {e}", reply_markup=keyboard())
+            await q.edit_message_text(f"Ошибка публикации: {e}", reply_markup=KEYBOARD)
         return
 
     if q.data == "clr":
-        DRAFTS[uid] = Draft()
+        reset_draft(uid)
         await q.edit_message_text("🧹 Черновик очищен.")
-        sched = SCHEDULES.pop(uid, None)
-        if sched and not sched.task.done():
-            sched.task.cancel()
+        sched = pop_schedule(uid)
+        if sched and sched.active():
+            sched.cancel()
         return
 
 
 # ---------- СТАРТ ----------
+class OrjsonRequest(HTTPXRequest):
+    """HTTPXRequest, разбирающий ответы Telegram через orjson вместо stdlib json."""
+
+    @staticmethod
+    def parse_json_payload(payload: bytes) -> dict:
+        try:
+            return orjson.loads(payload)
+        except ValueError as exc:
+            logger.error("Can not load invalid JSON data: %r", payload)
+            raise TelegramError("Invalid server response") from exc
+
+
 async def on_startup(app):
     me = await app.bot.get_me()
     logger.info("Bot started as @%s", me.username)
     logger.info("Target channel: %s", TARGET_CHAT)
     logger.info("Admin user_id: %s", ADMIN_USER_ID)
+    restore_state(app)
+
+
+def restore_state(app) -> None:
+    """Поднять черновики и таймеры из SQLite после рестарта; просроченные таймеры выбрасываем."""
+    if DB is None:
+        return
+    for uid, data in DB.execute("SELECT uid, data FROM drafts").fetchall():
+        d = DRAFTS[uid] = draft_from_json(data)
+        draft_changed(uid, d)
+    now = datetime.now(LOCAL_TZ)
+    for uid, at, data in DB.execute("SELECT uid, at, data FROM schedules").fetchall():
+        when = datetime.fromisoformat(at).astimezone(LOCAL_TZ)
+        if when <= now:
+            logger.info("Dropping past-due timer of user_id %s (%s)", uid, at)
+            pop_schedule(uid)
+            continue
+        schedule_publish(uid, draft_from_json(data), when, (when - now).total_seconds(), app)
+    logger.info("Restored %d draft(s), %d timer(s)", len(DRAFTS), len(SCHEDULES))
 
 
 def main() -> None:
-    # Фикс для Python 3.14: создать event loop в главном потоке при необходимости
+    # Ставим loop явно: run_polling в PTB 21.x берёт его через get_event_loop(),
+    # а в Python 3.14 тот больше не создаёт loop сам.
+    # uvloop — более быстрый loop на libuv; если не установлен, работаем на стандартном.
     try:
-        asyncio.get_running_loop()
-    except RuntimeError:
-        asyncio.set_event_loop(asyncio.new_event_loop())
+        import uvloop
+
+        loop = uvloop.new_event_loop()
+    except ImportError:
+        loop = asyncio.new_event_loop()
+    asyncio.set_event_loop(loop)
 
-    app = ApplicationBuilder().token(BOT_TOKEN).post_init(on_startup).build()
+    db_open(DB_PATH)
+
+    builder = ApplicationBuilder().token(BOT_TOKEN).post_init(on_startup)
+    if orjson is not None:
+        # те же размеры пулов, что PTB ставит по умолчанию
+        builder = builder.request(OrjsonRequest(connection_pool_size=256)).get_updates_request(
+            OrjsonRequest(connection_pool_size=1)
+        )
+    app = builder.build()
 
     # Команды
-    app.add_handler(CommandHandler("start", cmd_start))
-    app.add_handler(CommandHandler("whoami", cmd_whoami))
-    app.add_handler(CommandHandler("timer", cmd_timer))
-    app.add_handler(CommandHandler("cancel_timer", cmd_cancel_timer))
-    app.add_handler(CommandHandler("when", cmd_when))
+    app.add_handler(CommandHandler("start", cmd_start, filters=ADMIN_FILTER))
+    app.add_handler(CommandHandler("whoami", cmd_whoami, filters=ADMIN_FILTER))
+    app.add_handler(CommandHandler("timer", cmd_timer, filters=ADMIN_FILTER))
+    app.add_handler(CommandHandler("cancel_timer", cmd_cancel_timer, filters=ADMIN_FILTER))
+    app.add_handler(CommandHandler("when", cmd_when, filters=ADMIN_FILTER))
 
     # Медиа и текст
-    app.add_handler(MessageHandler(filters.PHOTO & ~filters.COMMAND, on_photo))
-    app.add_handler(MessageHandler(filters.VIDEO & ~filters.COMMAND, on_video))
-    app.add_handler(MessageHandler(filters.Document.ALL & ~filters.COMMAND, on_document))
-    app.add_handler(MessageHandler(filters.ANIMATION & ~filters.COMMAND, on_animation))
-    app.add_handler(MessageHandler(filters.AUDIO & ~filters.COMMAND, on_audio))
-    app.add_handler(MessageHandler(filters.VOICE & ~filters.COMMAND, on_voice))
-    app.add_handler(MessageHandler(filters.TEXT & ~filters.COMMAND, on_text))
+    app.add_handler(MessageHandler(filters.PHOTO & ~filters.COMMAND & ADMIN_FILTER, on_photo))
+    app.add_handler(MessageHandler(filters.VIDEO & ~filters.COMMAND & ADMIN_FILTER, on_video))
+    app.add_handler(MessageHandler(filters.Document.ALL & ~filters.COMMAND & ADMIN_FILTER, on_document))
+    app.add_handler(MessageHandler(filters.ANIMATION & ~filters.COMMAND & ADMIN_FILTER, on_animation))
+    app.add_handler(MessageHandler(filters.AUDIO & ~filters.COMMAND & ADMIN_FILTER, on_audio))
+    app.add_handler(MessageHandler(filters.VOICE & ~filters.COMMAND & ADMIN_FILTER, on_voice))
+    app.add_handler(MessageHandler(filters.TEXT & ~filters.COMMAND & ADMIN_FILTER, on_text))
 
     # Кнопки
     app.add_handler(CallbackQueryHandler(on_cb))